@@ -23,6 +23,9 @@ export async function POST(request: NextRequest) {
     // Query the RAG service with MCP optimization
     const queryParams = new URLSearchParams({
       q: question,
+      // Lean response: only ids, scores and short snippets are needed here
+      fields: 'id,score,rank,snippet',
+      snippet_chars: '240',
       ...(context && { context })
     });
 
@@ -45,6 +48,8 @@ export async function POST(request: NextRequest) {
     console.log('MCP RAG Query Success:', {
       question: question.substring(0, 50) + '...',
       resultsCount: data.results?.length || 0,
+      responseBytes: response.headers.get('x-response-bytes'),
+      serializationMs: response.headers.get('x-serialization-ms'),
       timestamp: new Date().toISOString()
     });
 
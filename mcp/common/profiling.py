@@ -0,0 +1,229 @@
+"""
+Opt-in per-request profiling for the MCP Python services.
+
+A request is profiled when profiling is switched on through the admin
+endpoint and the request falls within the sample rate, or when it carries
+an `X-Profile: 1` header together with the admin token in `X-Admin-Token`
+(the token is not needed when PROFILING_ALLOW_HEADER=true). The admin
+endpoints stay disabled until PROFILING_ADMIN_TOKEN is set.
+
+Code marks its stages with `span()`; a request that is not being profiled
+only pays for one context variable lookup per span.
+
+Finished profiles are kept in a ring buffer and exported as folded stacks
+(`frame;frame;frame <microseconds>`), the input format of flamegraph.pl,
+speedscope and inferno.
+
+Shared by the RAG and Docling services; their images copy it to /common.
+"""
+
+from fastapi import APIRouter, FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hmac
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+class RequestProfile:
+    """Span timings for one request, keyed by their full stack path"""
+
+    def __init__(self, profile_id: int, method: str, path: str):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.status_code: Optional[int] = None
+        self.totals: Dict[Tuple[str, ...], float] = {}
+        self._root = f"{method} {path}"
+        self._stack: List[Tuple[str, float]] = [(self._root, time.perf_counter())]
+
+    def enter(self, name: str):
+        self._stack.append((name, time.perf_counter()))
+
+    def exit(self):
+        _, started = self._stack[-1]
+        path = tuple(frame for frame, _ in self._stack)
+        self.totals[path] = self.totals.get(path, 0.0) + time.perf_counter() - started
+        self._stack.pop()
+
+    def finish(self):
+        while self._stack:
+            self.exit()
+        self.duration_ms = self.totals[(self._root,)] * 1000
+
+    def folded(self) -> List[str]:
+        """Folded-stack lines with each frame's self time in microseconds"""
+        self_times = dict(self.totals)
+        for path, total in self.totals.items():
+            if len(path) > 1 and path[:-1] in self_times:
+                self_times[path[:-1]] -= total
+        return [
+            f"{';'.join(path)} {max(int(seconds * 1_000_000), 0)}"
+            for path, seconds in self_times.items()
+        ]
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "stages_ms": {
+                ";".join(path[1:]): round(seconds * 1000, 3)
+                for path, seconds in self.totals.items() if len(path) > 1
+            }
+        }
+
+@contextmanager
+def span(name: str):
+    """Time a stage of the current request if it is being profiled"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit()
+
+class ProfilingSettings(BaseModel):
+    enabled: bool
+    sample_rate: Optional[float] = None
+
+class Profiler:
+    """Sampling decision, ring buffer and admin routes for request profiles"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.enabled = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+        self.sample_rate = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+        self.admin_token = os.getenv("PROFILING_ADMIN_TOKEN")
+        self.allow_header = os.getenv("PROFILING_ALLOW_HEADER", "false").lower() == "true"
+        self.profiles: deque = deque(maxlen=int(os.getenv("PROFILING_BUFFER_SIZE", "50")))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def token_valid(self, token: Optional[str]) -> bool:
+        return bool(self.admin_token) and token is not None \
+            and hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    def should_profile(self, headers: List[Tuple[bytes, bytes]]) -> bool:
+        requested = None
+        token = None
+        for key, value in headers:
+            if key == b"x-profile":
+                requested = value.lower() in (b"1", b"true")
+            elif key == b"x-admin-token":
+                token = value.decode("latin-1")
+
+        if requested is not None and (self.allow_header or self.token_valid(token)):
+            return requested
+        return self.enabled and random.random() < self.sample_rate
+
+    def record(self, profile: RequestProfile):
+        with self._lock:
+            self.profiles.append(profile)
+
+    def install(self, app: FastAPI):
+        app.add_middleware(ProfilingMiddleware, profiler=self)
+        app.include_router(self._admin_router())
+
+    def _check_token(self, token: Optional[str]):
+        if not self.admin_token:
+            raise HTTPException(status_code=403, detail="Profiling admin is disabled (set PROFILING_ADMIN_TOKEN)")
+        if not self.token_valid(token):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    def _admin_router(self) -> APIRouter:
+        router = APIRouter(prefix="/admin", tags=["profiling"])
+
+        @router.get("/profiling")
+        async def get_profiling(x_admin_token: Optional[str] = Header(None)):
+            """Current profiling settings and ring buffer usage"""
+            self._check_token(x_admin_token)
+            return {
+                "service": self.service,
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "buffer_size": self.profiles.maxlen,
+                "profiles_stored": len(self.profiles)
+            }
+
+        @router.post("/profiling")
+        async def set_profiling(settings: ProfilingSettings, x_admin_token: Optional[str] = Header(None)):
+            """Switch sampled profiling on or off"""
+            self._check_token(x_admin_token)
+            if settings.sample_rate is not None:
+                if not 0.0 <= settings.sample_rate <= 1.0:
+                    raise HTTPException(status_code=400, detail="sample_rate must be between 0.0 and 1.0")
+                self.sample_rate = settings.sample_rate
+            self.enabled = settings.enabled
+            return {"enabled": self.enabled, "sample_rate": self.sample_rate}
+
+        @router.get("/profiles")
+        async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+            """Most recent request profiles, newest first"""
+            self._check_token(x_admin_token)
+            return {"profiles": [p.summary() for p in reversed(list(self.profiles))]}
+
+        @router.get("/profiles/folded", response_class=PlainTextResponse)
+        async def all_profiles_folded(x_admin_token: Optional[str] = Header(None)):
+            """All stored profiles merged into one folded-stack file"""
+            self._check_token(x_admin_token)
+            return "\n".join(line for p in list(self.profiles) for line in p.folded()) + "\n"
+
+        @router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+        async def profile_folded(profile_id: int, x_admin_token: Optional[str] = Header(None)):
+            """One request profile as a folded-stack file"""
+            self._check_token(x_admin_token)
+            for profile in list(self.profiles):
+                if profile.profile_id == profile_id:
+                    return "\n".join(profile.folded()) + "\n"
+            raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+
+        return router
+
+class ProfilingMiddleware:
+    """Plain ASGI middleware, so unprofiled requests skip straight to the app"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/") \
+                or not self.profiler.should_profile(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(next(self.profiler._ids), scope["method"], scope["path"])
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", str(profile.profile_id).encode())
+                ]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current_profile.reset(token)
+            profile.finish()
+            self.profiler.record(profile)
@@ -0,0 +1,99 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import Profiler, RequestProfile, span
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_folded_reports_self_time_per_stack(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(profiling.time, "perf_counter", clock)
+
+    profile = RequestProfile(1, "POST", "/query")
+    profile.enter("encode")
+    clock.now = 0.003
+    profile.exit()
+    profile.enter("search")
+    profile.enter("faiss")
+    clock.now = 0.005
+    profile.exit()
+    clock.now = 0.006
+    profile.exit()
+    clock.now = 0.010
+    profile.finish()
+
+    assert sorted(profile.folded()) == sorted([
+        "POST /query 4000",
+        "POST /query;encode 3000",
+        "POST /query;search 1000",
+        "POST /query;search;faiss 2000",
+    ])
+    assert profile.duration_ms == pytest.approx(10.0)
+    assert profile.summary()["stages_ms"]["search;faiss"] == pytest.approx(2.0)
+
+def test_span_is_a_no_op_without_a_profile():
+    with span("encode"):
+        pass
+
+def headers(**values):
+    return [(k.replace("_", "-").encode(), v.encode()) for k, v in values.items()]
+
+def make_profiler(monkeypatch, **env):
+    for key in ("PROFILING_ADMIN_TOKEN", "PROFILING_ALLOW_HEADER", "PROFILING_ENABLED"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    return Profiler("test-service")
+
+def test_profile_header_needs_the_admin_token(monkeypatch):
+    profiler = make_profiler(monkeypatch, PROFILING_ADMIN_TOKEN="secret")
+    assert not profiler.should_profile(headers(x_profile="1"))
+    assert not profiler.should_profile(headers(x_profile="1", x_admin_token="wrong"))
+    assert profiler.should_profile(headers(x_profile="1", x_admin_token="secret"))
+
+def test_profile_header_can_be_allowed_by_env(monkeypatch):
+    profiler = make_profiler(monkeypatch, PROFILING_ALLOW_HEADER="true")
+    assert profiler.should_profile(headers(x_profile="1"))
+    assert not profiler.should_profile(headers(x_profile="0"))
+
+def test_sampling_is_off_by_default(monkeypatch):
+    profiler = make_profiler(monkeypatch)
+    assert not any(profiler.should_profile([]) for _ in range(100))
+
+def make_app(profiler):
+    app = FastAPI()
+    profiler.install(app)
+
+    @app.get("/work")
+    async def work():
+        with span("stage"):
+            return {"ok": True}
+
+    return TestClient(app)
+
+def test_admin_endpoints_are_disabled_without_a_token(monkeypatch):
+    client = make_app(make_profiler(monkeypatch))
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.post("/admin/profiling", json={"enabled": True, "sample_rate": 1.0}).status_code == 403
+
+def test_profiled_request_is_served_as_folded_stacks(monkeypatch):
+    client = make_app(make_profiler(monkeypatch, PROFILING_ADMIN_TOKEN="secret"))
+    admin = {"X-Admin-Token": "secret"}
+
+    assert client.get("/work", headers={"X-Profile": "1"}).headers.get("x-profile-id") is None
+    response = client.get("/work", headers={"X-Profile": "1", **admin})
+    profile_id = response.headers["x-profile-id"]
+
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    profiles = client.get("/admin/profiles", headers=admin).json()["profiles"]
+    assert [p["id"] for p in profiles] == [int(profile_id)]
+
+    folded = client.get(f"/admin/profiles/{profile_id}", headers=admin).text.splitlines()
+    assert {line.rsplit(" ", 1)[0] for line in folded} == {"GET /work", "GET /work;stage"}
@@ -6,6 +6,11 @@ from typing import Optional
 import tempfile
 import os
 import logging
+import sys
+
+# Modules shared by the MCP Python services live in ../common (/common in the images)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from profiling import Profiler, span
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +18,10 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Docling MCP Service", version="1.0.0")
 
+# Opt-in request profiling (X-Profile header or /admin/profiling toggle)
+profiler = Profiler("docling-mcp-service")
+profiler.install(app)
+
 # Initialize Docling converter
 converter = DocumentConverter()
 
@@ -50,7 +59,7 @@ async def parse_document(file: UploadFile = File(...)):
             )
 
         # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
+        with span("read_upload"), tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
             content = await file.read()
             tmp_file.write(content)
             tmp_path = tmp_file.name
@@ -58,10 +67,12 @@ async def parse_document(file: UploadFile = File(...)):
         try:
             # Convert document using Docling
             logger.info(f"Parsing document: {file.filename}")
-            result = converter.convert(tmp_path)
+            with span("convert"):
+                result = converter.convert(tmp_path)
 
             # Extract text and metadata
-            text = result.document.export_to_markdown()
+            with span("export_markdown"):
+                text = result.document.export_to_markdown()
             metadata = {
                 "filename": file.filename,
                 "file_size": len(content),
@@ -94,10 +105,12 @@ async def parse_document_url(url: str):
     """Parse document from URL"""
     try:
         logger.info(f"Parsing document from URL: {url}")
-        result = converter.convert(url)
+        with span("convert"):
+            result = converter.convert(url)
 
         # Extract text and metadata
-        text = result.document.export_to_markdown()
+        with span("export_markdown"):
+            text = result.document.export_to_markdown()
         metadata = {
             "source_url": url,
             "pages": len(result.document.pages) if hasattr(result.document, 'pages') else 1,
@@ -126,7 +139,9 @@ async def root():
         "endpoints": {
             "health": "/health",
             "parse": "/parse",
-            "parse_url": "/parse-url"
+            "parse_url": "/parse-url",
+            "profiling": "/admin/profiling",
+            "profiles": "/admin/profiles"
         }
     }
 
@@ -1,20 +1,244 @@
-from fastapi import FastAPI
+from fastapi import Body, FastAPI
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import requests
+import threading
+import time
 import uvicorn
 
 app = FastAPI(title="RAG Service", version="1.0.0")
 
+DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+# Fraction of wall time the reindex worker may spend computing; it sleeps the rest
+REINDEX_DUTY_CYCLE = min(max(float(os.getenv("RAG_REINDEX_DUTY_CYCLE", "0.25")), 0.01), 1.0)
+REINDEX_BATCH_SIZE = int(os.getenv("RAG_REINDEX_BATCH_SIZE", "32"))
+# The RAG MCP service (mcp/rag_service) that embeds and searches the documents,
+# e.g. http://rag_service:8001; changed documents are pushed to its /add_documents
+RAG_SERVICE_URL = os.getenv("RAG_SERVICE_URL", "").rstrip("/")
+RAG_SERVICE_TIMEOUT = float(os.getenv("RAG_SERVICE_TIMEOUT", "30"))
+# documents.json is only rewritten once the document log has grown past this size
+LOG_COMPACT_BYTES = int(os.getenv("RAG_LOG_COMPACT_BYTES", str(4 * 1024 * 1024)))
+
+state_lock = threading.Lock()   # guards the in-memory state below
+log_lock = threading.Lock()     # orders appends to, and rotation of, the document log
+documents: Dict[str, Dict] = {}     # id -> {"id", "text", "seq", "updated_at"}
+# Changes are ordered by a sequence number rather than the wall clock, so a clock
+# step cannot hide a document below the watermark
+next_seq = 1
+watermark = 0                       # documents with a higher seq still need pushing
+watermark_time: Optional[float] = None
+reindex_status: Dict = {"state": "idle"}
+reindex_thread: Optional[threading.Thread] = None
+reindex_pending = False
+reindex_pending_full = False        # a queued follow-up asked for a full pass
+
+def iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z") if ts else None
+
+def data_path(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
+
+def write_atomic(path: str, data: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def apply_document(doc: Dict):
+    """Keep the newest version of a document; log replays may repeat entries"""
+    global next_seq
+    existing = documents.get(doc["id"])
+    if existing is None or existing["seq"] < doc["seq"]:
+        documents[doc["id"]] = doc
+    next_seq = max(next_seq, doc["seq"] + 1)
+
+def load_state():
+    """Load the compacted documents, replay the document log on top, then the watermark"""
+    global watermark, watermark_time
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    if os.path.exists(data_path("documents.json")):
+        with open(data_path("documents.json")) as f:
+            for doc in json.load(f).values():
+                apply_document(doc)
+
+    # documents.log.old only survives a crash in the middle of compaction
+    for log_name in ("documents.log.old", "documents.log"):
+        if os.path.exists(data_path(log_name)):
+            with open(data_path(log_name)) as f:
+                for line in f:
+                    if line.strip():
+                        apply_document(json.loads(line))
+
+    if os.path.exists(data_path("watermark.json")):
+        with open(data_path("watermark.json")) as f:
+            stored = json.load(f)
+            watermark = stored["watermark"]
+            watermark_time = stored.get("watermark_time")
+
+    print(f"RAG state loaded: {len(documents)} documents, watermark {watermark} ({iso(watermark_time)})")
+
+def push_documents(batch: List[Dict]):
+    """Send changed documents to the RAG MCP service, which embeds them with its model"""
+    if not RAG_SERVICE_URL:
+        raise RuntimeError("RAG_SERVICE_URL is not set")
+    response = requests.post(
+        f"{RAG_SERVICE_URL}/add_documents",
+        json={"documents": [
+            {"id": d["id"], "content": d["text"], "metadata": {"seq": d["seq"], "updated_at": iso(d["updated_at"])}}
+            for d in batch
+        ]},
+        timeout=RAG_SERVICE_TIMEOUT
+    )
+    response.raise_for_status()
+
+def compact_document_log():
+    """Fold the document log into documents.json once it is large enough, off the state lock"""
+    with log_lock:
+        if not os.path.exists(data_path("documents.log")):
+            return
+        if os.path.getsize(data_path("documents.log")) < LOG_COMPACT_BYTES:
+            return
+        with state_lock:
+            snapshot = dict(documents)
+        # Appends after this point go to a fresh log and are replayed on top
+        os.replace(data_path("documents.log"), data_path("documents.log.old"))
+
+    write_atomic(data_path("documents.json"), snapshot)
+    os.remove(data_path("documents.log.old"))
+
+def upsert_content(content: Dict) -> Optional[str]:
+    """Store content sent by the orchestrator; it is pushed by the next reindex"""
+    global next_seq
+    text = content.get("text") or content.get("markdown") or content.get("html")
+    if not text:
+        return None
+
+    doc_id = content.get("id") or hashlib.sha1(text.encode("utf-8")).hexdigest()
+    with state_lock:
+        existing = documents.get(doc_id)
+        if existing is not None and existing["text"] == text:
+            return doc_id
+        doc = {"id": doc_id, "text": text, "seq": next_seq, "updated_at": time.time()}
+        next_seq += 1
+        documents[doc_id] = doc
+
+    # One appended line per change; the reindex job folds the log into documents.json
+    with log_lock, open(data_path("documents.log"), "a") as f:
+        f.write(json.dumps(doc) + "\n")
+    return doc_id
+
+def run_reindex(full: bool):
+    """Push documents changed since the watermark to the RAG service, throttled to the duty cycle"""
+    global watermark, watermark_time, reindex_status, reindex_pending, reindex_pending_full, reindex_thread
+
+    while True:
+        with state_lock:
+            # A pass covers every trigger that arrived before its cutoff
+            full = full or reindex_pending_full
+            reindex_pending = False
+            reindex_pending_full = False
+            cutoff = next_seq - 1
+            since = 0 if full else watermark
+            changed = [d for d in documents.values() if since < d["seq"] <= cutoff]
+
+        started = time.time()
+        reindex_status = {
+            "state": "running",
+            "full": full,
+            "started_at": iso(started),
+            "since": since,
+            "total": len(changed),
+            "processed": 0
+        }
+
+        try:
+            for start in range(0, len(changed), REINDEX_BATCH_SIZE):
+                batch = changed[start:start + REINDEX_BATCH_SIZE]
+                work_started = time.perf_counter()
+                push_documents(batch)
+                reindex_status["processed"] += len(batch)
+
+                # Leave the RAG service room to answer queries while we catch up
+                work = time.perf_counter() - work_started
+                time.sleep(work * (1 - REINDEX_DUTY_CYCLE) / REINDEX_DUTY_CYCLE)
+
+            compact_document_log()
+
+            with state_lock:
+                watermark = cutoff
+                watermark_time = max((d["updated_at"] for d in changed), default=watermark_time)
+                write_atomic(data_path("watermark.json"), {"watermark": watermark, "watermark_time": watermark_time})
+
+            reindex_status = {
+                **reindex_status,
+                "state": "completed",
+                "finished_at": iso(time.time()),
+                "duration_seconds": round(time.time() - started, 3),
+                "watermark": watermark
+            }
+            print(f"RAG reindex pushed {len(changed)} documents, watermark now {watermark}")
+
+        except Exception as e:
+            print(f"RAG reindex failed: {e}")
+            reindex_status = {**reindex_status, "state": "failed", "error": str(e)}
+
+        # Decide to stop and give up the running slot in one step, so a trigger
+        # that arrives in between is either seen here or starts a new worker
+        with state_lock:
+            if not reindex_pending:
+                reindex_thread = None
+                return
+        full = False
+
+def start_reindex(full: bool) -> bool:
+    """Start the background job, or mark a follow-up pass if one is already running"""
+    global reindex_thread, reindex_pending, reindex_pending_full
+    with state_lock:
+        if reindex_thread is not None:
+            reindex_pending = True
+            reindex_pending_full |= full
+            return False
+        reindex_thread = threading.Thread(target=run_reindex, args=(full,), name="rag-reindex", daemon=True)
+        reindex_thread.start()
+        return True
+
+load_state()
+
 @app.get("/health")
 def health():
     return {"ok": True, "service": "RAG"}
 
 @app.post("/reindex")
-def reindex():
-    print("RAG reindex triggered by orchestrator")
-    return {"ok": True, "message": "RAG reindex triggered"}
+def reindex(payload: Optional[Dict] = Body(None)):
+    payload = payload or {}
+    doc_id = upsert_content(payload["content"]) if isinstance(payload.get("content"), dict) else None
+    started = start_reindex(bool(payload.get("full", False)))
+    print(f"RAG reindex triggered by {payload.get('source', 'orchestrator')}")
+    return {
+        "ok": True,
+        "message": "RAG reindex triggered" if started else "RAG reindex already running, queued follow-up",
+        "document_id": doc_id,
+        "watermark": watermark
+    }
 
 @app.get("/latest")
 def latest():
-    return {"ok": True, "content": "Latest RAG content", "timestamp": "2025-10-14T00:00:00Z"}
+    with state_lock:
+        latest_doc = max(documents.values(), key=lambda d: d["seq"], default=None)
+        pending = sum(1 for d in documents.values() if d["seq"] > watermark)
+    return {
+        "ok": True,
+        "content": latest_doc["text"] if latest_doc else None,
+        "timestamp": iso(watermark_time),
+        "watermark": watermark,
+        "documents": len(documents),
+        "pending": pending,
+        "reindex": reindex_status
+    }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Service modules are imported top-level, as they are when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.py loads its state at import time; keep that away from the real data directory
+os.environ.setdefault("RAG_DATA_DIR", tempfile.mkdtemp(prefix="rag-test-"))
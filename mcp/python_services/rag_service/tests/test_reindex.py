@@ -0,0 +1,183 @@
+import json
+import threading
+
+import pytest
+
+import app as rag
+
+pushed = []  # ids sent to the RAG service, in order
+real_push_documents = rag.push_documents
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(rag, "REINDEX_DUTY_CYCLE", 1.0)
+    monkeypatch.setattr(rag, "LOG_COMPACT_BYTES", 0)
+    pushed.clear()
+    monkeypatch.setattr(rag, "push_documents", lambda batch: pushed.extend(d["id"] for d in batch))
+    rag.documents.clear()
+    monkeypatch.setattr(rag, "next_seq", 1)
+    monkeypatch.setattr(rag, "watermark", 0)
+    monkeypatch.setattr(rag, "watermark_time", None)
+    monkeypatch.setattr(rag, "reindex_thread", None)
+    monkeypatch.setattr(rag, "reindex_pending", False)
+    monkeypatch.setattr(rag, "reindex_pending_full", False)
+    yield
+    thread = rag.reindex_thread
+    if thread is not None:
+        thread.join(timeout=10)
+
+def wait_idle():
+    thread = rag.reindex_thread
+    if thread is not None:
+        thread.join(timeout=10)
+    assert rag.reindex_thread is None
+
+def test_only_documents_changed_since_the_watermark_are_pushed(monkeypatch):
+    rag.upsert_content({"id": "a", "text": "oak"})
+    rag.upsert_content({"id": "b", "text": "pine"})
+    rag.run_reindex(full=False)
+    assert rag.watermark == 2
+    assert rag.reindex_status["total"] == 2
+
+    rag.upsert_content({"id": "b", "text": "pine, updated"})
+    rag.upsert_content({"id": "a", "text": "oak"})  # unchanged text is not a change
+    rag.run_reindex(full=False)
+    assert rag.reindex_status["total"] == 1
+    assert rag.watermark == 3
+    assert pushed == ["a", "b", "b"]
+
+def test_watermark_does_not_depend_on_the_wall_clock(monkeypatch):
+    rag.upsert_content({"id": "a", "text": "before"})
+    rag.run_reindex(full=False)
+
+    # The clock steps back an hour
+    monkeypatch.setattr(rag.time, "time", lambda: 0.0)
+    rag.upsert_content({"id": "b", "text": "after"})
+    rag.run_reindex(full=False)
+
+    assert rag.reindex_status["total"] == 1
+    assert pushed == ["a", "b"]
+
+def test_full_reindex_pushes_everything():
+    rag.upsert_content({"id": "a", "text": "oak"})
+    rag.run_reindex(full=False)
+    rag.run_reindex(full=True)
+    assert rag.reindex_status["total"] == 1
+
+def test_trigger_while_worker_is_finishing_is_not_lost(monkeypatch):
+    entered = threading.Event()
+    release = threading.Event()
+    real_compact = rag.compact_document_log
+
+    def slow_compact():
+        entered.set()
+        release.wait(timeout=10)
+        real_compact()
+
+    monkeypatch.setattr(rag, "compact_document_log", slow_compact)
+    rag.upsert_content({"id": "a", "text": "first"})
+    assert rag.start_reindex(full=False)
+    assert entered.wait(timeout=10)
+
+    rag.upsert_content({"id": "b", "text": "second"})
+    assert not rag.start_reindex(full=False)
+    monkeypatch.setattr(rag, "compact_document_log", real_compact)
+    release.set()
+
+    wait_idle()
+    assert sorted(pushed) == ["a", "b"]
+    assert rag.watermark == 2
+
+def test_full_trigger_while_worker_runs_queues_a_full_pass(monkeypatch):
+    entered = threading.Event()
+    release = threading.Event()
+    real_compact = rag.compact_document_log
+
+    def slow_compact():
+        entered.set()
+        release.wait(timeout=10)
+        real_compact()
+
+    monkeypatch.setattr(rag, "compact_document_log", slow_compact)
+    rag.upsert_content({"id": "a", "text": "oak"})
+    rag.upsert_content({"id": "b", "text": "pine"})
+    assert rag.start_reindex(full=False)
+    assert entered.wait(timeout=10)
+
+    assert not rag.start_reindex(full=True)
+    monkeypatch.setattr(rag, "compact_document_log", real_compact)
+    release.set()
+
+    wait_idle()
+    assert rag.reindex_status["full"] is True
+    assert rag.reindex_status["total"] == 2
+    assert rag.reindex_pending_full is False
+
+def test_worker_releases_its_slot_after_a_failure(monkeypatch):
+    def broken(batch):
+        raise RuntimeError("boom")
+
+    working = rag.push_documents
+    monkeypatch.setattr(rag, "push_documents", broken)
+    rag.upsert_content({"id": "a", "text": "oak"})
+    assert rag.start_reindex(full=False)
+    wait_idle()
+    assert rag.reindex_status["state"] == "failed"
+    assert rag.watermark == 0
+
+    monkeypatch.setattr(rag, "push_documents", working)
+    assert rag.start_reindex(full=False)
+    wait_idle()
+    assert rag.watermark == 1
+
+def test_state_survives_a_restart_through_the_document_log():
+    rag.upsert_content({"id": "a", "text": "oak"})
+    rag.run_reindex(full=False)
+    rag.upsert_content({"id": "a", "text": "oak, revised"})
+    rag.upsert_content({"id": "b", "text": "pine"})
+
+    rag.documents.clear()
+    rag.next_seq = 1
+    rag.load_state()
+
+    assert rag.documents["a"]["text"] == "oak, revised"
+    assert rag.next_seq == 4
+    assert rag.watermark == 1
+    assert rag.latest()["pending"] == 2
+
+def test_document_log_is_only_compacted_past_the_threshold(monkeypatch, tmp_path):
+    monkeypatch.setattr(rag, "LOG_COMPACT_BYTES", 1024)
+    rag.upsert_content({"id": "a", "text": "oak"})
+    rag.run_reindex(full=False)
+    assert not (tmp_path / "documents.json").exists()
+    assert (tmp_path / "documents.log").exists()
+
+    rag.upsert_content({"id": "b", "text": "pine " * 300})
+    rag.run_reindex(full=False)
+    assert set(json.loads((tmp_path / "documents.json").read_text())) == {"a", "b"}
+    assert not (tmp_path / "documents.log").exists()
+
+def test_push_sends_documents_to_the_rag_service(monkeypatch):
+    sent = {}
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+    def fake_post(url, json, timeout):
+        sent.update(url=url, body=json)
+        return Response()
+
+    monkeypatch.setattr(rag.requests, "post", fake_post)
+    doc = {"id": "a", "text": "oak", "seq": 3, "updated_at": 0.0}
+
+    monkeypatch.setattr(rag, "RAG_SERVICE_URL", "")
+    with pytest.raises(RuntimeError):
+        real_push_documents([doc])
+
+    monkeypatch.setattr(rag, "RAG_SERVICE_URL", "http://rag:8001")
+    real_push_documents([doc])
+    assert sent["url"] == "http://rag:8001/add_documents"
+    assert sent["body"]["documents"][0]["id"] == "a"
+    assert sent["body"]["documents"][0]["content"] == "oak"
@@ -0,0 +1,190 @@
+"""
+Versioned FAISS index and document store for the RAG MCP service.
+
+Kept free of the sentence-transformer model so it can be unit-tested on its own.
+"""
+
+import asyncio
+import faiss
+import numpy as np
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class IndexSnapshot(NamedTuple):
+    """View of the vector store that a query pins for its whole lifetime.
+
+    `documents` and `embeddings` are append-only and shared with later
+    snapshots of the same index; only the first `size` entries belong to
+    this one.
+    """
+    generation: int
+    epoch: int  # bumped by clear() so stale background rebuilds can be discarded
+    size: int
+    documents: List[Dict]
+    embeddings: List[np.ndarray]  # chunks of rows, in document order
+    index: faiss.Index
+    index_factory: str
+    search_params: str  # faiss.ParameterSpace string such as "nprobe=16"
+
+def build_index(dimension: int, index_factory: str, embeddings: np.ndarray,
+                search_params: str = "") -> faiss.Index:
+    """Build (and train, if the index type needs it) a FAISS index over `embeddings`.
+
+    `search_params` are applied with faiss.ParameterSpace, e.g. "nprobe=16"
+    for IVF indexes, which otherwise search a single list. Parameters the
+    index type does not have raise a RuntimeError.
+    """
+    new_index = faiss.index_factory(dimension, index_factory)
+    if not new_index.is_trained:
+        if not len(embeddings):
+            raise ValueError(f"Index type '{index_factory}' needs training data; add documents first")
+        new_index.train(embeddings)
+    if search_params:
+        faiss.ParameterSpace().set_index_parameters(new_index, search_params)
+    if len(embeddings):
+        new_index.add(embeddings)
+    return new_index
+
+def compact_documents(documents: List[Dict], embeddings: np.ndarray) -> Tuple[List[Dict], np.ndarray]:
+    """Drop superseded chunks, keeping only the latest version of each document id"""
+    latest = {}
+    for position, doc in enumerate(documents):
+        latest[doc["id"]] = position
+    keep = sorted(latest.values())
+    return [documents[i] for i in keep], embeddings[keep]
+
+def embedding_rows(chunks: List[np.ndarray], start: int, stop: int, dimension: int) -> np.ndarray:
+    """Rows `start:stop` of the concatenated chunks, copying only the chunks involved"""
+    rows = []
+    offset = 0
+    for chunk in list(chunks):
+        if offset >= stop:
+            break
+        if offset + len(chunk) > start:
+            rows.append(chunk[max(start - offset, 0):stop - offset])
+        offset += len(chunk)
+    return np.vstack(rows) if rows else np.empty((0, dimension), dtype='float32')
+
+class IndexHolder:
+    """Versioned holder for the vector store.
+
+    Readers call `snapshot()` and never lock. Every mutation runs on the
+    event loop, the same thread as searches, since FAISS does not allow
+    adding to and searching one index concurrently: adds append to the live
+    index and lists in place and publish a snapshot with the new size.
+    Rebuilds build a separate index in a background thread and hand it back
+    to the loop, which folds in documents added meanwhile and swaps it in.
+    """
+
+    def __init__(self, dimension: int, index_factory: str = "Flat"):
+        self.dimension = dimension
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self.rebuild_status: Dict = {"state": "idle"}
+        self._current = self._empty_snapshot(0, 0, index_factory)
+
+    def _empty_snapshot(self, generation: int, epoch: int, index_factory: str) -> IndexSnapshot:
+        empty = np.empty((0, self.dimension), dtype='float32')
+        return IndexSnapshot(
+            generation, epoch, 0, [], [],
+            build_index(self.dimension, index_factory, empty), index_factory, ""
+        )
+
+    def snapshot(self) -> IndexSnapshot:
+        return self._current
+
+    def add(self, new_docs: List[Dict], new_embeddings: np.ndarray) -> IndexSnapshot:
+        current = self._current
+        current.index.add(new_embeddings)
+        current.documents.extend(new_docs)
+        current.embeddings.append(new_embeddings)
+        self._current = current._replace(
+            generation=current.generation + 1,
+            size=current.size + len(new_docs)
+        )
+        return self._current
+
+    def clear(self) -> IndexSnapshot:
+        """Publish an empty flat index; a trained quantizer would describe data that is gone"""
+        current = self._current
+        self._current = self._empty_snapshot(current.generation + 1, current.epoch + 1, "Flat")
+        return self._current
+
+    def start_rebuild(self, index_factory: str, compact: bool, search_params: str = "") -> bool:
+        """Start a background rebuild from the event loop; returns False if one is already running"""
+        if self.rebuild_status["state"] == "running":
+            return False
+
+        self.rebuild_status = {
+            "state": "running",
+            "index_factory": index_factory,
+            "compact": compact,
+            "search_params": search_params,
+            "base_generation": self._current.generation
+        }
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(asyncio.get_running_loop(), index_factory, compact, search_params),
+            name="index-rebuild", daemon=True
+        )
+        self._rebuild_thread.start()
+        return True
+
+    def _rebuild(self, loop: asyncio.AbstractEventLoop, index_factory: str, compact: bool,
+                 search_params: str):
+        started = time.perf_counter()
+        base = self._current
+        try:
+            documents = base.documents[:base.size]
+            embeddings = embedding_rows(base.embeddings, 0, base.size, self.dimension)
+            if compact:
+                documents, embeddings = compact_documents(documents, embeddings)
+            new_index = build_index(self.dimension, index_factory, embeddings, search_params)
+        except Exception as e:
+            logger.error(f"Error rebuilding index: {str(e)}")
+            self.rebuild_status = {**self.rebuild_status, "state": "failed", "error": str(e)}
+            return
+
+        loop.call_soon_threadsafe(
+            self._publish_rebuild, base, documents, embeddings, new_index,
+            index_factory, search_params, started
+        )
+
+    def _publish_rebuild(self, base: IndexSnapshot, documents: List[Dict], embeddings: np.ndarray,
+                         new_index: faiss.Index, index_factory: str, search_params: str, started: float):
+        """Fold documents added during the build into the new index and swap it in, on the loop"""
+        try:
+            current = self._current
+            if current.epoch != base.epoch:
+                logger.info("Discarding index rebuild: vector store was cleared meanwhile")
+                self.rebuild_status = {**self.rebuild_status, "state": "discarded"}
+                return
+
+            # Only appends can happen while we build, so the delta is a suffix
+            delta_docs = current.documents[base.size:current.size]
+            delta_embeddings = embedding_rows(current.embeddings, base.size, current.size, self.dimension)
+            if len(delta_embeddings):
+                new_index.add(delta_embeddings)
+
+            self._current = IndexSnapshot(
+                current.generation + 1, current.epoch,
+                len(documents) + len(delta_docs),
+                documents + delta_docs,
+                [embeddings, delta_embeddings],
+                new_index, index_factory, search_params
+            )
+
+            duration = time.perf_counter() - started
+            logger.info(f"Index rebuild published generation {self._current.generation} in {duration:.2f}s")
+            self.rebuild_status = {
+                **self.rebuild_status,
+                "state": "completed",
+                "generation": self._current.generation,
+                "duration_seconds": round(duration, 3)
+            }
+
+        except Exception as e:
+            logger.error(f"Error publishing index rebuild: {str(e)}")
+            self.rebuild_status = {**self.rebuild_status, "state": "failed", "error": str(e)}
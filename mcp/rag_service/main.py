@@ -1,47 +1,45 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 import json
 import os
 import logging
-from typing import List, Dict, Optional
+import sys
+import time
+from typing import Dict, Optional
 import requests
 
+from index_store import IndexHolder
+from models import AddDocumentRequest, BatchQueryRequest, BatchQueryResponse, QueryRequest, QueryResponse
+from results import DEFAULT_SNIPPET_CHARS, collect_batch_results, extract_snippet, parse_fields
+
+# Modules shared by the MCP Python services live in ../common (/common in the images)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from profiling import Profiler, span
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="RAG MCP Service", version="1.0.0")
 
+# Opt-in request profiling (X-Profile header or /admin/profiling toggle)
+profiler = Profiler("rag-mcp-service")
+profiler.install(app)
+
 # Initialize sentence transformer model
 model = SentenceTransformer('all-MiniLM-L6-v2')
 
-# Initialize FAISS index
 dimension = 384  # Dimension of all-MiniLM-L6-v2 embeddings
-index = faiss.IndexFlatL2(dimension)
-
-# Store for document chunks and metadata
-documents = []
-doc_embeddings = []
-
-class Document(BaseModel):
-    id: str
-    content: str
-    metadata: Optional[Dict] = {}
 
-class QueryRequest(BaseModel):
-    query: str
-    top_k: int = 5
-    threshold: float = 0.7
+# Set when this instance runs as one partition behind router.py
+shard_id = os.getenv("RAG_SHARD_ID")
 
-class QueryResponse(BaseModel):
-    query: str
-    results: List[Dict]
-    confidence: float
-    source: str
+# Versioned FAISS index and document store
+index_holder = IndexHolder(dimension)
 
 class HealthResponse(BaseModel):
     status: str
@@ -49,8 +47,31 @@ class HealthResponse(BaseModel):
     version: str
     documents_count: int
 
-class AddDocumentRequest(BaseModel):
-    documents: List[Document]
+class RebuildRequest(BaseModel):
+    index_factory: str = "Flat"
+    compact: bool = True
+    # faiss.ParameterSpace string, e.g. "nprobe=16" for IVF (which defaults to nprobe=1)
+    search_params: str = ""
+
+def fast_json_response(payload: Dict) -> Response:
+    """Serialize an already well-formed payload without pydantic re-validation.
+
+    The encoded size and serialization time are reported in the
+    `X-Response-Bytes` and `X-Serialization-Ms` headers.
+    """
+    started = time.perf_counter()
+    with span("serialize"):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={
+            "X-Response-Bytes": str(len(body)),
+            "X-Serialization-Ms": f"{elapsed_ms:.3f}"
+        }
+    )
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -59,40 +80,38 @@ async def health_check():
         status="healthy",
         service="rag-mcp-service",
         version="1.0.0",
-        documents_count=len(documents)
+        documents_count=index_holder.snapshot().size
     )
 
 @app.post("/add_documents")
 async def add_documents(request: AddDocumentRequest):
     """Add documents to the vector store"""
     try:
-        new_docs = []
-        new_embeddings = []
-
-        for doc in request.documents:
-            # Generate embedding
-            embedding = model.encode(doc.content)
-
-            new_docs.append({
-                "id": doc.id,
-                "content": doc.content,
-                "metadata": doc.metadata
-            })
-            new_embeddings.append(embedding)
+        new_docs = [
+            {"id": doc.id, "content": doc.content, "metadata": doc.metadata}
+            for doc in request.documents
+        ]
 
-        # Add to FAISS index
-        if new_embeddings:
-            embeddings_array = np.array(new_embeddings).astype('float32')
-            index.add(embeddings_array)
-            documents.extend(new_docs)
-            doc_embeddings.extend(new_embeddings)
+        # Publish a new snapshot with the documents added
+        snapshot = index_holder.snapshot()
+        if new_docs:
+            # Encode the whole request in one call, off the event loop
+            with span("encode"):
+                embeddings_array = np.asarray(
+                    await run_in_threadpool(model.encode, [doc["content"] for doc in new_docs]),
+                    dtype='float32'
+                )
+            # Appends on the event loop, like searches, so the two never overlap
+            with span("index_add"):
+                snapshot = index_holder.add(new_docs, embeddings_array)
 
         logger.info(f"Added {len(new_docs)} documents to vector store")
 
         return {
             "status": "success",
             "documents_added": len(new_docs),
-            "total_documents": len(documents)
+            "total_documents": snapshot.size,
+            "generation": snapshot.generation
         }
 
     except Exception as e:
@@ -101,73 +120,145 @@ async def add_documents(request: AddDocumentRequest):
 
 @app.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
-    """Query documents using vector similarity search"""
+    """Query documents using vector similarity search
+
+    `fields` projects each result onto a subset of keys (e.g. `id,score`) and
+    `snippet_chars` adds a `snippet` cut around the matched query terms;
+    asking for the `snippet` field alone uses DEFAULT_SNIPPET_CHARS.
+    """
     try:
-        if len(documents) == 0:
-            return QueryResponse(
-                query=request.query,
-                results=[],
-                confidence=0.0,
-                source="rag-mcp-service"
-            )
+        fields = parse_fields(request.fields)
+        snippet_chars = request.snippet_chars
+        if snippet_chars <= 0 and fields is not None and "snippet" in fields:
+            snippet_chars = DEFAULT_SNIPPET_CHARS
+        snapshot = index_holder.snapshot()
+        documents = snapshot.documents
+        size = snapshot.size
+
+        if size == 0:
+            return fast_json_response({
+                "query": request.query,
+                "results": [],
+                "confidence": 0.0,
+                "source": "rag-mcp-service"
+            })
 
         # Generate query embedding
-        query_embedding = model.encode(request.query)
+        with span("encode"):
+            query_embedding = model.encode(request.query)
         query_array = np.array([query_embedding]).astype('float32')
 
         # Search in FAISS index
-        k = min(request.top_k, len(documents))
-        distances, indices = index.search(query_array, k)
+        k = min(request.top_k, size)
+        with span("faiss_search"):
+            distances, indices = snapshot.index.search(query_array, k)
 
         # Prepare results
         results = []
         for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(documents):
+            if 0 <= idx < size:
                 # Convert distance to similarity score (0-1)
                 similarity = 1 / (1 + distance)
 
                 if similarity >= request.threshold:
                     doc = documents[idx]
-                    results.append({
+                    result = {
                         "id": doc["id"],
                         "content": doc["content"],
                         "metadata": doc["metadata"],
                         "similarity_score": float(similarity),
                         "rank": i + 1
-                    })
+                    }
+                    if snippet_chars > 0:
+                        result["snippet"] = extract_snippet(doc["content"], request.query, snippet_chars)
+                    results.append(result)
 
         # Calculate overall confidence
         confidence = max([r["similarity_score"] for r in results], default=0.0) if results else 0.0
 
+        if fields is not None:
+            results = [{f: r[f] for f in fields if f in r} for r in results]
+
         logger.info(f"Query processed: '{request.query}' - Found {len(results)} relevant documents")
 
-        return QueryResponse(
-            query=request.query,
-            results=results,
-            confidence=confidence,
-            source="rag-mcp-service"
-        )
+        return fast_json_response({
+            "query": request.query,
+            "results": results,
+            "confidence": confidence,
+            "source": "rag-mcp-service"
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error querying documents: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error querying documents: {str(e)}")
 
 @app.get("/query")
-async def query_documents_get(q: str, top_k: int = 5, threshold: float = 0.7):
+async def query_documents_get(q: str, top_k: int = 5, threshold: float = 0.7,
+                              fields: Optional[str] = None, snippet_chars: int = 0):
     """Query documents using GET request (for simple testing)"""
-    request = QueryRequest(query=q, top_k=top_k, threshold=threshold)
+    request = QueryRequest(
+        query=q, top_k=top_k, threshold=threshold,
+        fields=fields, snippet_chars=snippet_chars
+    )
     return await query_documents(request)
 
+@app.post("/query_batch", response_model=BatchQueryResponse)
+async def query_documents_batch(request: BatchQueryRequest):
+    """Query several reformulations at once with a single encode and a single index search.
+
+    Hits reference their document through ``doc``; each matched document's
+    payload is returned once in ``documents`` no matter how many queries
+    matched it.
+    """
+    try:
+        snapshot = index_holder.snapshot()
+        documents = snapshot.documents
+        size = snapshot.size
+
+        if not request.queries or size == 0:
+            return fast_json_response({
+                "results": [
+                    {"query": item.query, "results": [], "confidence": 0.0}
+                    for item in request.queries
+                ],
+                "documents": {},
+                "source": "rag-mcp-service"
+            })
+
+        # Encode every query in one batch and search them as one matrix
+        with span("encode"):
+            query_array = np.asarray(
+                model.encode([item.query for item in request.queries]), dtype='float32'
+            )
+        max_k = min(max(item.top_k for item in request.queries), size)
+        with span("faiss_search"):
+            distances, indices = snapshot.index.search(query_array, max_k)
+
+        results, matched_docs = collect_batch_results(request.queries, distances, indices, documents, size)
+
+        logger.info(
+            f"Batch query processed: {len(request.queries)} queries - "
+            f"Found {len(matched_docs)} distinct relevant documents"
+        )
+
+        return fast_json_response({
+            "results": results,
+            "documents": matched_docs,
+            "source": "rag-mcp-service"
+        })
+
+    except Exception as e:
+        logger.error(f"Error querying documents in batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error querying documents in batch: {str(e)}")
+
 @app.delete("/clear")
 async def clear_documents():
     """Clear all documents from the vector store"""
     try:
-        global documents, doc_embeddings, index
-
-        # Reset everything
-        documents = []
-        doc_embeddings = []
-        index = faiss.IndexFlatL2(dimension)
+        # Publish an empty snapshot; in-flight queries keep their pinned one
+        index_holder.clear()
 
         logger.info("Cleared all documents from vector store")
 
@@ -184,11 +275,30 @@ async def clear_documents():
 @app.get("/stats")
 async def get_stats():
     """Get vector store statistics"""
+    snapshot = index_holder.snapshot()
     return {
-        "total_documents": len(documents),
-        "index_size": index.ntotal,
+        "total_documents": snapshot.size,
+        "index_size": snapshot.index.ntotal,
+        "index_factory": snapshot.index_factory,
+        "search_params": snapshot.search_params,
+        "generation": snapshot.generation,
+        "rebuild": index_holder.rebuild_status,
         "embedding_dimension": dimension,
-        "model": "all-MiniLM-L6-v2"
+        "model": "all-MiniLM-L6-v2",
+        "shard_id": shard_id
+    }
+
+@app.post("/rebuild", status_code=202)
+async def rebuild_index(request: RebuildRequest):
+    """Rebuild (and optionally compact) the index in the background, then swap it in atomically"""
+    if not index_holder.start_rebuild(request.index_factory, request.compact, request.search_params):
+        raise HTTPException(status_code=409, detail="An index rebuild is already running")
+
+    logger.info(f"Started background index rebuild with '{request.index_factory}'")
+
+    return {
+        "status": "accepted",
+        "rebuild": index_holder.rebuild_status
     }
 
 @app.post("/sync_from_docling")
@@ -237,16 +347,20 @@ async def root():
         "endpoints": {
             "health": "/health",
             "query": "/query",
+            "query_batch": "/query_batch",
             "add_documents": "/add_documents",
             "stats": "/stats",
             "clear": "/clear",
+            "rebuild": "/rebuild",
+            "profiling": "/admin/profiling",
+            "profiles": "/admin/profiles",
             "sync_from_docling": "/sync_from_docling"
         },
         "model": "all-MiniLM-L6-v2",
         "vector_dimension": dimension,
-        "documents_count": len(documents)
+        "documents_count": index_holder.snapshot().size
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8001")))
\ No newline at end of file
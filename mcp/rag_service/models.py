@@ -0,0 +1,47 @@
+"""
+Request and response models for the RAG MCP service.
+
+Kept free of the model and FAISS so the shard router (router.py) accepts
+exactly what each shard does.
+"""
+
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+import os
+
+# Upper bound on reformulations per /query_batch call
+MAX_BATCH_QUERIES = int(os.getenv("RAG_MAX_BATCH_QUERIES", "64"))
+
+class Document(BaseModel):
+    id: str
+    content: str
+    metadata: Optional[Dict] = {}
+
+class AddDocumentRequest(BaseModel):
+    documents: List[Document]
+
+class QueryRequest(BaseModel):
+    query: str
+    top_k: int = 5
+    threshold: float = 0.7
+    fields: Optional[str] = None
+    snippet_chars: int = 0
+
+class QueryResponse(BaseModel):
+    query: str
+    results: List[Dict]
+    confidence: float
+    source: str
+
+class BatchQueryItem(BaseModel):
+    query: str
+    top_k: int = Field(5, ge=1)
+    threshold: float = 0.7
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem] = Field(..., max_length=MAX_BATCH_QUERIES)
+
+class BatchQueryResponse(BaseModel):
+    results: List[Dict]
+    documents: Dict[str, Dict]
+    source: str
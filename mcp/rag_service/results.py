@@ -0,0 +1,121 @@
+"""
+Result shaping for the RAG MCP service.
+
+Kept free of the model and FAISS so it can be shared with router.py and
+unit-tested on its own.
+"""
+
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+
+# Result fields that can be requested via `fields`, plus short aliases
+RESULT_FIELDS = {"id", "content", "metadata", "similarity_score", "rank", "snippet"}
+FIELD_ALIASES = {"score": "similarity_score"}
+
+# Snippet length used when `snippet` is requested without `snippet_chars`
+DEFAULT_SNIPPET_CHARS = 240
+
+WHITESPACE = re.compile(r"\s+")
+WORD = re.compile(r"\w+")
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated projection such as `id,score` into result keys"""
+    if not fields:
+        return None
+
+    selected = []
+    for name in fields.split(","):
+        name = FIELD_ALIASES.get(name.strip(), name.strip())
+        if not name:
+            continue
+        if name not in RESULT_FIELDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field: {name}. Allowed: {sorted(RESULT_FIELDS | set(FIELD_ALIASES))}"
+            )
+        if name not in selected:
+            selected.append(name)
+    return selected
+
+def extract_snippet(content: str, query: str, max_chars: int) -> str:
+    """Return a window of `content` around the first query term it contains.
+
+    Terms only match at the start of a word, the matched word is kept whole
+    whenever it fits, and the window is trimmed to whole words where the
+    content allows it.
+    """
+    if len(content) <= max_chars:
+        return content
+
+    # Search the original text: lower() can change its length and shift offsets
+    word_start = word_end = 0
+    matches = []
+    for term in re.findall(r"\w+", query):
+        if len(term) > 2:
+            match = re.search(r"\b" + re.escape(term), content, re.IGNORECASE)
+            if match:
+                matches.append(match.start())
+    if matches:
+        word_start = min(matches)
+        word_end = WORD.match(content, word_start).end()
+
+    # Centre the whole matched word in the window
+    padding = max(max_chars - (word_end - word_start), 0) // 2
+    start = max(0, min(word_start - padding, len(content) - max_chars))
+    end = start + max_chars
+    if start > 0 and not content[start - 1].isspace():
+        gap = WHITESPACE.search(content, start, word_start)
+        if gap:
+            start = gap.end()
+    if end < len(content) and not content[end].isspace():
+        gaps = list(WHITESPACE.finditer(content, max(word_end, start), end + 1))
+        if gaps:
+            end = gaps[-1].start()
+
+    snippet = content[start:end].strip()
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(content) else "")
+
+def collect_batch_results(queries: Sequence, distances, indices, documents: Sequence[Dict],
+                          size: Optional[int] = None) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """Turn one matrix search into per-query hits plus de-duplicated payloads.
+
+    `distances`/`indices` are the rows returned by `index.search` for
+    `queries` (items with `query`, `top_k` and `threshold`). Payloads are
+    keyed by store position rather than id, because the store may hold
+    several versions of the same id until it is compacted; each hit points
+    at its payload through `doc`. Only the first `size` documents (default:
+    all of them) are eligible.
+    """
+    size = len(documents) if size is None else size
+    results = []
+    payloads = {}
+    for item, row_distances, row_indices in zip(queries, distances, indices):
+        hits = []
+        for i, (distance, idx) in enumerate(zip(row_distances[:item.top_k], row_indices[:item.top_k])):
+            if 0 <= idx < size:
+                # Convert distance to similarity score (0-1)
+                similarity = 1 / (1 + distance)
+
+                if similarity >= item.threshold:
+                    doc = documents[idx]
+                    key = str(int(idx))
+                    payloads.setdefault(key, {
+                        "id": doc["id"],
+                        "content": doc["content"],
+                        "metadata": doc["metadata"]
+                    })
+                    hits.append({
+                        "id": doc["id"],
+                        "doc": key,
+                        "similarity_score": float(similarity),
+                        "rank": i + 1
+                    })
+
+        results.append({
+            "query": item.query,
+            "results": hits,
+            "confidence": max([h["similarity_score"] for h in hits], default=0.0)
+        })
+
+    return results, payloads
@@ -0,0 +1,280 @@
+from fastapi import FastAPI, HTTPException
+from bisect import bisect_right
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import logging
+import os
+from typing import List, Dict, Optional
+import httpx
+
+from models import AddDocumentRequest, BatchQueryRequest, BatchQueryResponse, QueryRequest, QueryResponse
+from results import RESULT_FIELDS, parse_fields
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await client.aclose()
+
+app = FastAPI(title="RAG MCP Shard Router", version="1.0.0", lifespan=lifespan)
+
+# Shard configuration, e.g. RAG_SHARDS=http://localhost:8101,http://localhost:8102
+SHARDS = [url.strip().rstrip("/") for url in os.getenv("RAG_SHARDS", "").split(",") if url.strip()]
+SHARD_STRATEGY = os.getenv("RAG_SHARD_STRATEGY", "hash")  # "hash" or "range"
+# For range sharding: N-1 sorted id boundaries, shard i owns ids < boundary i
+SHARD_RANGES = [b.strip() for b in os.getenv("RAG_SHARD_RANGES", "").split(",") if b.strip()]
+# Deadline for each shard's whole call, enforced in fan_out()
+SHARD_TIMEOUT = float(os.getenv("RAG_SHARD_TIMEOUT", "2.0"))
+
+if SHARD_STRATEGY not in ("hash", "range"):
+    raise RuntimeError(f"Unknown RAG_SHARD_STRATEGY: {SHARD_STRATEGY}")
+if SHARD_STRATEGY == "range" and len(SHARD_RANGES) != max(len(SHARDS) - 1, 0):
+    raise RuntimeError("RAG_SHARD_RANGES must list one boundary fewer than RAG_SHARDS")
+if SHARD_RANGES != sorted(SHARD_RANGES):
+    raise RuntimeError("RAG_SHARD_RANGES boundaries must be in ascending order")
+
+# Shared async connection pool so fan-out requests reuse keep-alive connections
+# without holding a worker thread per shard call
+client = httpx.AsyncClient(
+    timeout=SHARD_TIMEOUT,
+    limits=httpx.Limits(max_connections=max(len(SHARDS), 1) * 8)
+)
+
+class RoutedQueryResponse(QueryResponse):
+    shards_failed: List[Dict] = []
+
+class RoutedBatchQueryResponse(BatchQueryResponse):
+    shards_failed: List[Dict] = []
+
+def shard_for(doc_id: str) -> int:
+    """Return the index of the shard that owns `doc_id`"""
+    if SHARD_STRATEGY == "range":
+        return bisect_right(SHARD_RANGES, doc_id)
+    # Stable across processes, unlike the builtin hash()
+    digest = hashlib.md5(doc_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % len(SHARDS)
+
+async def call_shard(method: str, shard_url: str, path: str, payload: Optional[Dict] = None) -> Dict:
+    response = await client.request(method, f"{shard_url}{path}", json=payload)
+    response.raise_for_status()
+    return response.json()
+
+async def call_shard_with_deadline(method: str, shard_id: int, path: str, payload: Optional[Dict]) -> Dict:
+    # httpx's timeout only bounds each connect/read; the deadline covers the
+    # whole call, and cancelling it releases the connection straight away
+    try:
+        return await asyncio.wait_for(call_shard(method, SHARDS[shard_id], path, payload), SHARD_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"no response within {SHARD_TIMEOUT}s")
+
+async def fan_out(method: str, path: str, payloads: Dict[int, Optional[Dict]]):
+    """Call shards concurrently, each with a SHARD_TIMEOUT deadline.
+
+    Returns ({shard: response}, [failed shard info]).
+    """
+    shard_ids = list(payloads)
+    responses = await asyncio.gather(
+        *(call_shard_with_deadline(method, i, path, payloads[i]) for i in shard_ids),
+        return_exceptions=True
+    )
+
+    succeeded = {}
+    failed = []
+    for shard_id, response in zip(shard_ids, responses):
+        if isinstance(response, Exception):
+            logger.warning(f"Shard {shard_id} ({SHARDS[shard_id]}) failed on {path}: {str(response)}")
+            failed.append({"shard": shard_id, "url": SHARDS[shard_id], "error": str(response)})
+        else:
+            succeeded[shard_id] = response
+
+    if not succeeded and failed:
+        raise HTTPException(status_code=503, detail=f"All shards failed on {path}: {failed}")
+    return succeeded, failed
+
+def merge_hits(hit_lists: List[List[Dict]], top_k: int) -> List[Dict]:
+    """Merge per-shard hit lists by similarity score and re-rank the global top-k"""
+    merged = sorted(
+        (hit for hits in hit_lists for hit in hits),
+        key=lambda hit: hit["similarity_score"],
+        reverse=True
+    )[:top_k]
+    for i, hit in enumerate(merged):
+        hit["rank"] = i + 1
+    return merged
+
+def require_shards():
+    if not SHARDS:
+        raise HTTPException(status_code=503, detail="No shards configured (set RAG_SHARDS)")
+
+@app.get("/health")
+async def health_check():
+    """Aggregate health of all shards"""
+    require_shards()
+    succeeded, failed = await fan_out("GET", "/health", {i: None for i in range(len(SHARDS))})
+    return {
+        "status": "healthy" if not failed else "degraded",
+        "service": "rag-mcp-router",
+        "version": "1.0.0",
+        "documents_count": sum(r.get("documents_count", 0) for r in succeeded.values()),
+        "shards_total": len(SHARDS),
+        "shards_failed": failed
+    }
+
+@app.post("/add_documents")
+async def add_documents(request: AddDocumentRequest):
+    """Route each document to the shard that owns its id"""
+    require_shards()
+    grouped: Dict[int, List[Dict]] = {}
+    for doc in request.documents:
+        grouped.setdefault(shard_for(doc.id), []).append(doc.model_dump())
+
+    succeeded, failed = await fan_out(
+        "POST", "/add_documents", {i: {"documents": docs} for i, docs in grouped.items()}
+    )
+
+    if failed:
+        # Adds are not idempotent across shards, so surface partial writes instead of hiding them
+        raise HTTPException(
+            status_code=502,
+            detail={
+                "message": "Some shards failed to add documents",
+                "documents_added": sum(len(grouped[i]) for i in succeeded),
+                "shards_failed": failed
+            }
+        )
+
+    logger.info(f"Routed {len(request.documents)} documents to {len(grouped)} shards")
+
+    return {
+        "status": "success",
+        "documents_added": len(request.documents),
+        "shards": {str(i): len(docs) for i, docs in grouped.items()}
+    }
+
+@app.post("/query", response_model=RoutedQueryResponse)
+async def query_documents(request: QueryRequest):
+    """Scatter the query to every shard and gather the global top-k"""
+    require_shards()
+    fields = parse_fields(request.fields)
+
+    # Shards must return scores for the merge even if the caller did not ask for them
+    shard_request = request.model_dump()
+    if fields is not None:
+        shard_request["fields"] = ",".join(set(fields) | {"similarity_score"})
+
+    succeeded, failed = await fan_out(
+        "POST", "/query", {i: shard_request for i in range(len(SHARDS))}
+    )
+
+    results = merge_hits([r["results"] for r in succeeded.values()], request.top_k)
+    confidence = max([r["similarity_score"] for r in results], default=0.0)
+    if fields is not None:
+        results = [{f: r[f] for f in fields if f in r} for r in results]
+
+    return {
+        "query": request.query,
+        "results": results,
+        "confidence": confidence,
+        "source": "rag-mcp-router",
+        "shards_failed": failed
+    }
+
+@app.get("/query")
+async def query_documents_get(q: str, top_k: int = 5, threshold: float = 0.7,
+                              fields: Optional[str] = None, snippet_chars: int = 0):
+    """Query documents using GET request (for simple testing)"""
+    request = QueryRequest(
+        query=q, top_k=top_k, threshold=threshold,
+        fields=fields, snippet_chars=snippet_chars
+    )
+    return await query_documents(request)
+
+@app.post("/query_batch", response_model=RoutedBatchQueryResponse)
+async def query_documents_batch(request: BatchQueryRequest):
+    """Scatter a query batch to every shard and merge the results per query"""
+    require_shards()
+    succeeded, failed = await fan_out(
+        "POST", "/query_batch", {i: request.model_dump() for i in range(len(SHARDS))}
+    )
+
+    # Payload keys are store positions, so prefix them with the shard to keep them unique
+    for shard_id, response in succeeded.items():
+        for query_result in response["results"]:
+            for hit in query_result["results"]:
+                hit["doc"] = f"{shard_id}:{hit['doc']}"
+
+    results = []
+    for position, item in enumerate(request.queries):
+        hits = merge_hits([r["results"][position]["results"] for r in succeeded.values()], item.top_k)
+        results.append({
+            "query": item.query,
+            "results": hits,
+            "confidence": max([h["similarity_score"] for h in hits], default=0.0)
+        })
+
+    # Only return payloads for documents that survived the merge
+    kept_keys = {hit["doc"] for r in results for hit in r["results"]}
+    documents = {}
+    for shard_id, response in succeeded.items():
+        for key, payload in response["documents"].items():
+            if f"{shard_id}:{key}" in kept_keys:
+                documents[f"{shard_id}:{key}"] = payload
+
+    return {
+        "results": results,
+        "documents": documents,
+        "source": "rag-mcp-router",
+        "shards_failed": failed
+    }
+
+@app.delete("/clear")
+async def clear_documents():
+    """Clear every shard"""
+    require_shards()
+    succeeded, failed = await fan_out("DELETE", "/clear", {i: None for i in range(len(SHARDS))})
+    return {
+        "status": "success" if not failed else "partial",
+        "message": f"Cleared {len(succeeded)} of {len(SHARDS)} shards",
+        "shards_failed": failed
+    }
+
+@app.get("/stats")
+async def get_stats():
+    """Per-shard vector store statistics"""
+    require_shards()
+    succeeded, failed = await fan_out("GET", "/stats", {i: None for i in range(len(SHARDS))})
+    return {
+        "total_documents": sum(s.get("total_documents", 0) for s in succeeded.values()),
+        "strategy": SHARD_STRATEGY,
+        "shard_timeout_seconds": SHARD_TIMEOUT,
+        "shards": {str(i): {"url": SHARDS[i], **stats} for i, stats in succeeded.items()},
+        "shards_failed": failed
+    }
+
+@app.get("/")
+async def root():
+    """Root endpoint with router information"""
+    return {
+        "service": "RAG MCP Shard Router",
+        "version": "1.0.0",
+        "description": "Scatter-gather router over sharded RAG MCP services",
+        "endpoints": {
+            "health": "/health",
+            "query": "/query",
+            "query_batch": "/query_batch",
+            "add_documents": "/add_documents",
+            "stats": "/stats",
+            "clear": "/clear"
+        },
+        "strategy": SHARD_STRATEGY,
+        "shards": SHARDS,
+        "result_fields": sorted(RESULT_FIELDS)
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8001")))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Run a sharded RAG MCP setup on one machine.
+
+Starts N shard instances of main.py on consecutive ports and the
+scatter-gather router (router.py) in front of them, e.g.:
+
+    python run_local_shards.py --shards 3 --base-port 8101 --router-port 8001
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sharded RAG services locally")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--base-port", type=int, default=8101)
+    parser.add_argument("--router-port", type=int, default=8001)
+    parser.add_argument("--strategy", choices=["hash", "range"], default="hash")
+    parser.add_argument("--ranges", default="", help="comma-separated id boundaries for range sharding")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-shard timeout in seconds")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    processes = []
+    shard_urls = []
+
+    try:
+        for shard in range(args.shards):
+            port = args.base_port + shard
+            shard_urls.append(f"http://127.0.0.1:{port}")
+            env = {**os.environ, "RAG_SHARD_ID": str(shard)}
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                cwd=here, env=env
+            ))
+            print(f"Started shard {shard} on port {port}")
+
+        env = {
+            **os.environ,
+            "RAG_SHARDS": ",".join(shard_urls),
+            "RAG_SHARD_STRATEGY": args.strategy,
+            "RAG_SHARD_RANGES": args.ranges,
+            "RAG_SHARD_TIMEOUT": str(args.timeout)
+        }
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "router:app", "--host", "0.0.0.0", "--port", str(args.router_port)],
+            cwd=here, env=env
+        ))
+        print(f"Started router on port {args.router_port} -> {', '.join(shard_urls)}")
+
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+        print("A service exited, shutting down the rest")
+
+    except KeyboardInterrupt:
+        print("Stopping sharded RAG services...")
+
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from results import collect_batch_results
+
+def item(query, top_k=5, threshold=0.0):
+    return SimpleNamespace(query=query, top_k=top_k, threshold=threshold)
+
+DOCUMENTS = [
+    {"id": "oak", "content": "old oak text", "metadata": {"v": 1}},
+    {"id": "pine", "content": "pine text", "metadata": {}},
+    {"id": "oak", "content": "new oak text", "metadata": {"v": 2}},
+]
+
+def test_each_query_honours_its_own_top_k():
+    results, _ = collect_batch_results(
+        [item("a", top_k=1), item("b", top_k=3)],
+        [[0.0, 1.0, 2.0], [0.0, 1.0, 2.0]],
+        [[0, 1, 2], [1, 2, 0]],
+        DOCUMENTS
+    )
+    assert [h["id"] for h in results[0]["results"]] == ["oak"]
+    assert [h["rank"] for h in results[1]["results"]] == [1, 2, 3]
+
+def test_threshold_filters_hits_and_sets_confidence():
+    results, payloads = collect_batch_results([item("a", threshold=0.4)], [[0.0, 3.0]], [[1, 0]], DOCUMENTS)
+    assert [h["id"] for h in results[0]["results"]] == ["pine"]
+    assert results[0]["confidence"] == 1.0
+    assert list(payloads) == ["1"]
+
+def test_payloads_are_shared_between_queries():
+    results, payloads = collect_batch_results(
+        [item("a"), item("b")], [[0.0], [0.5]], [[1], [1]], DOCUMENTS
+    )
+    assert results[0]["results"][0]["doc"] == results[1]["results"][0]["doc"] == "1"
+    assert len(payloads) == 1
+
+def test_versions_of_the_same_id_keep_their_own_payload():
+    results, payloads = collect_batch_results([item("a")], [[0.0, 0.1]], [[0, 2]], DOCUMENTS)
+    contents = [payloads[h["doc"]]["content"] for h in results[0]["results"]]
+    assert contents == ["old oak text", "new oak text"]
+
+def test_missing_neighbours_are_skipped():
+    results, _ = collect_batch_results([item("a")], [[0.0, 0.0]], [[-1, 5]], DOCUMENTS)
+    assert results[0]["results"] == []
@@ -0,0 +1,162 @@
+import asyncio
+import functools
+import threading
+
+import faiss
+import numpy as np
+
+import index_store
+from index_store import IndexHolder, compact_documents, embedding_rows
+
+DIMENSION = 4
+
+def vectors(*rows):
+    return np.array(rows, dtype='float32')
+
+def docs(*ids):
+    return [{"id": doc_id, "content": doc_id, "metadata": {}} for doc_id in ids]
+
+def block_rebuild(monkeypatch):
+    """Hold the background rebuild inside build_index until the returned event is set"""
+    building = threading.Event()
+    release = threading.Event()
+    real_build = index_store.build_index
+
+    def slow_build(*args):
+        if threading.current_thread().name == "index-rebuild":
+            building.set()
+            release.wait(timeout=10)
+        return real_build(*args)
+
+    monkeypatch.setattr(index_store, "build_index", slow_build)
+    return building, release
+
+def on_event_loop(test):
+    """Run an async test on its own event loop, which owns the holder like the service's does"""
+    @functools.wraps(test)
+    def wrapper(*args, **kwargs):
+        return asyncio.run(test(*args, **kwargs))
+    return wrapper
+
+async def wait_for_rebuild(holder):
+    """Let the event loop run until the rebuild has been published or given up"""
+    for _ in range(1000):
+        if holder.rebuild_status["state"] != "running":
+            break
+        await asyncio.sleep(0.01)
+    return holder.rebuild_status
+
+async def wait_until_building(building):
+    assert await asyncio.get_running_loop().run_in_executor(None, building.wait, 10)
+
+def test_compact_keeps_latest_version_of_each_id():
+    documents = docs("a", "b", "a")
+    kept, embeddings = compact_documents(documents, vectors([1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0]))
+    assert [d["id"] for d in kept] == ["b", "a"]
+    assert kept[1] is documents[2]
+    np.testing.assert_array_equal(embeddings, vectors([0, 1, 0, 0], [0, 0, 1, 0]))
+
+def test_embedding_rows_spans_chunks():
+    chunks = [vectors([0] * 4, [1] * 4), vectors([2] * 4), vectors([3] * 4, [4] * 4)]
+    np.testing.assert_array_equal(embedding_rows(chunks, 1, 4, DIMENSION)[:, 0], [1, 2, 3])
+    assert embedding_rows(chunks, 5, 5, DIMENSION).shape == (0, DIMENSION)
+
+def test_add_appends_in_place_and_old_snapshots_keep_their_size():
+    holder = IndexHolder(DIMENSION)
+    first = holder.add(docs("a"), vectors([1, 0, 0, 0]))
+    second = holder.add(docs("b"), vectors([0, 1, 0, 0]))
+
+    assert second.index is first.index
+    assert (first.size, second.size) == (1, 2)
+    assert second.generation == first.generation + 1
+    assert second.index.ntotal == 2
+
+@on_event_loop
+async def test_clear_resets_to_a_flat_index():
+    holder = IndexHolder(DIMENSION)
+    holder.add(docs(*[str(i) for i in range(8)]), np.random.rand(8, DIMENSION).astype('float32'))
+    assert holder.start_rebuild("IVF2,Flat", compact=False)
+    assert (await wait_for_rebuild(holder))["state"] == "completed"
+    assert holder.snapshot().index_factory == "IVF2,Flat"
+
+    cleared = holder.clear()
+    assert cleared.index_factory == "Flat"
+    assert cleared.size == 0
+    # A single document can be added again without retraining anything
+    assert holder.add(docs("x"), vectors([1, 1, 1, 1])).size == 1
+
+@on_event_loop
+async def test_rebuild_compacts_and_swaps_index():
+    holder = IndexHolder(DIMENSION)
+    holder.add(docs("a", "b"), vectors([1, 0, 0, 0], [0, 1, 0, 0]))
+    old = holder.add(docs("a"), vectors([0, 0, 1, 0]))
+
+    assert holder.start_rebuild("Flat", compact=True)
+    assert (await wait_for_rebuild(holder))["state"] == "completed"
+
+    new = holder.snapshot()
+    assert new.index is not old.index
+    assert [d["id"] for d in new.documents[:new.size]] == ["b", "a"]
+    assert new.index.ntotal == 2
+    # The pinned snapshot still answers from the old index
+    assert old.index.ntotal == 3
+
+@on_event_loop
+async def test_rebuild_folds_in_documents_added_meanwhile(monkeypatch):
+    holder = IndexHolder(DIMENSION)
+    holder.add(docs("a"), vectors([1, 0, 0, 0]))
+
+    building, release = block_rebuild(monkeypatch)
+    assert holder.start_rebuild("Flat", compact=False)
+    await wait_until_building(building)
+    assert not holder.start_rebuild("Flat", compact=False)
+
+    holder.add(docs("b"), vectors([0, 1, 0, 0]))
+    release.set()
+    assert (await wait_for_rebuild(holder))["state"] == "completed"
+
+    snapshot = holder.snapshot()
+    assert [d["id"] for d in snapshot.documents[:snapshot.size]] == ["a", "b"]
+    _, indices = snapshot.index.search(vectors([0, 1, 0, 0]), 1)
+    assert indices[0][0] == 1
+
+@on_event_loop
+async def test_rebuild_is_discarded_if_store_was_cleared(monkeypatch):
+    holder = IndexHolder(DIMENSION)
+    holder.add(docs("a"), vectors([1, 0, 0, 0]))
+
+    building, release = block_rebuild(monkeypatch)
+    holder.start_rebuild("Flat", compact=False)
+    await wait_until_building(building)
+    holder.clear()
+    release.set()
+
+    assert (await wait_for_rebuild(holder))["state"] == "discarded"
+    assert holder.snapshot().size == 0
+
+@on_event_loop
+async def test_trained_index_types_need_documents():
+    holder = IndexHolder(DIMENSION)
+    holder.start_rebuild("IVF2,Flat", compact=False)
+    status = await wait_for_rebuild(holder)
+    assert status["state"] == "failed"
+    assert holder.snapshot().index_factory == "Flat"
+
+@on_event_loop
+async def test_rebuild_applies_search_params():
+    holder = IndexHolder(DIMENSION)
+    holder.add(docs(*[str(i) for i in range(8)]), np.random.rand(8, DIMENSION).astype('float32'))
+    assert holder.start_rebuild("IVF2,Flat", compact=False, search_params="nprobe=2")
+    assert (await wait_for_rebuild(holder))["state"] == "completed"
+
+    snapshot = holder.snapshot()
+    assert snapshot.search_params == "nprobe=2"
+    assert faiss.extract_index_ivf(snapshot.index).nprobe == 2
+
+@on_event_loop
+async def test_rebuild_rejects_unknown_search_params():
+    holder = IndexHolder(DIMENSION)
+    holder.add(docs("a"), vectors([1, 0, 0, 0]))
+    assert holder.start_rebuild("Flat", compact=False, search_params="nprobe=2")
+    assert (await wait_for_rebuild(holder))["state"] == "failed"
+    assert holder.snapshot().search_params == ""
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+
+from results import DEFAULT_SNIPPET_CHARS, extract_snippet, parse_fields
+
+def test_parse_fields_resolves_aliases_and_drops_duplicates():
+    assert parse_fields("id, score,similarity_score,") == ["id", "similarity_score"]
+
+def test_parse_fields_without_projection():
+    assert parse_fields(None) is None
+    assert parse_fields("") is None
+
+def test_parse_fields_rejects_unknown_fields():
+    with pytest.raises(HTTPException) as error:
+        parse_fields("id,embedding")
+    assert error.value.status_code == 400
+
+def test_short_content_is_returned_whole():
+    assert extract_snippet("Oak is strong.", "oak", 50) == "Oak is strong."
+
+def test_terms_match_on_word_boundaries():
+    content = "A cloak hung by the door. " + "filler " * 20 + "Oak flooring lasts for decades."
+    snippet = extract_snippet(content, "oak", 40)
+    assert "Oak flooring" in snippet
+    assert "cloak" not in snippet
+
+def test_window_is_snapped_to_whole_words():
+    content = " ".join(f"word{i}" for i in range(40)) + " oak " + " ".join(f"tail{i}" for i in range(40))
+    snippet = extract_snippet(content, "oak", 50)
+    assert snippet.startswith("...") and snippet.endswith("...")
+    words = snippet.strip(".").split()
+    assert "oak" in words
+    assert all(w.startswith(("word", "tail")) or w == "oak" for w in words)
+    assert all(w in content.split() for w in words)
+
+def test_without_a_match_the_snippet_starts_at_the_beginning():
+    content = "Joinery takes years to master. " * 10
+    snippet = extract_snippet(content, "walnut", 40)
+    assert not snippet.startswith("...")
+    assert snippet.endswith("...")
+    assert len(snippet) <= 40 + 3
+
+def test_default_snippet_length_is_positive():
+    assert DEFAULT_SNIPPET_CHARS > 0
+
+def test_offsets_survive_case_folding_that_changes_length():
+    content = "İstanbul " * 40 + "oak joinery " + "x " * 200
+    assert "oak" in extract_snippet(content, "oak", 30)
+
+def test_case_insensitive_match():
+    content = "filler " * 30 + "OAK flooring " + "tail " * 30
+    assert "OAK flooring" in extract_snippet(content, "oak", 40)
+
+def test_long_matched_word_stays_whole():
+    long_word = "supercalifragilisticexpialidocious"
+    content = "word " * 40 + long_word + " tail" * 40
+    snippet = extract_snippet(content, "supercal", 50)
+    assert long_word in snippet
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+os.environ.setdefault("RAG_SHARDS", "http://shard-0,http://shard-1,http://shard-2")
+
+import router
+
+def hit(doc_id, score):
+    return {"id": doc_id, "similarity_score": score, "rank": 0}
+
+def test_merge_hits_keeps_global_top_k_and_reranks():
+    merged = router.merge_hits(
+        [[hit("a", 0.9), hit("b", 0.4)], [hit("c", 0.8)], []], top_k=2
+    )
+    assert [h["id"] for h in merged] == ["a", "c"]
+    assert [h["rank"] for h in merged] == [1, 2]
+
+def test_hash_sharding_is_stable_and_in_range(monkeypatch):
+    monkeypatch.setattr(router, "SHARD_STRATEGY", "hash")
+    owners = [router.shard_for(f"doc-{i}") for i in range(200)]
+    assert owners == [router.shard_for(f"doc-{i}") for i in range(200)]
+    assert set(owners) == {0, 1, 2}
+
+def test_range_sharding_uses_sorted_boundaries(monkeypatch):
+    monkeypatch.setattr(router, "SHARD_STRATEGY", "range")
+    monkeypatch.setattr(router, "SHARD_RANGES", ["g", "n"])
+    assert [router.shard_for(i) for i in ["apple", "g", "kiwi", "n", "zebra"]] == [0, 1, 1, 2, 2]
+
+def test_fan_out_reports_slow_shards_as_failed(monkeypatch):
+    monkeypatch.setattr(router, "SHARD_TIMEOUT", 0.1)
+    cancelled = []
+
+    async def slow_shard(request):
+        if request.url.host == "shard-1":
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(request.url.host)
+                raise
+        return httpx.Response(200, json={"shard": request.url.host})
+
+    async def scenario():
+        monkeypatch.setattr(router, "client", httpx.AsyncClient(transport=httpx.MockTransport(slow_shard)))
+        return await router.fan_out("GET", "/stats", {0: None, 1: None, 2: None})
+
+    started = time.perf_counter()
+    succeeded, failed = asyncio.run(scenario())
+
+    assert time.perf_counter() - started < 0.8
+    assert sorted(succeeded) == [0, 2]
+    assert [f["shard"] for f in failed] == [1]
+    # The slow call is abandoned, not left running on a worker thread
+    assert cancelled == ["shard-1"]
+
+def test_fan_out_fails_when_every_shard_fails(monkeypatch):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("refused")
+
+    monkeypatch.setattr(router, "call_shard", broken)
+    with pytest.raises(router.HTTPException) as error:
+        asyncio.run(router.fan_out("GET", "/stats", {0: None, 1: None}))
+    assert error.value.status_code == 503